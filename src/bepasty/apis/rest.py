@@ -212,6 +212,10 @@ class ItemDetailView(DownloadView, RestBase):
     def err_incomplete(self, item, error):
         raise Conflict(description=error)
 
+    def etag(self, name):
+        # metadata may change, so no conditional requests here
+        return None
+
     def response(self, item, name):
         return jsonify({'uri': url_for('bepasty_apis.items_detail', name=name),
                         'file-meta': filter_internal(item.meta)})
@@ -1,3 +1,5 @@
+import glob
+import hashlib
 import os
 import pickle
 import logging
@@ -34,6 +36,9 @@ class Storage:
             raise RuntimeError
         return os.path.join(self.directory, name)
 
+    def _thumbnail_filename(self, name, thumbnail_type):
+        return self._filename(name) + '.thumb.' + thumbnail_type
+
     def _open(self, name, mode):
         basefilename = self._filename(name)
         file_data = open(basefilename + '.data', mode)
@@ -49,6 +54,14 @@ class Storage:
     def openwrite(self, name):
         return self._open(name, 'r+b')
 
+    def read_meta(self, name):
+        """
+        Return the metadata of item <name> (as a dict), without opening its data.
+        """
+        with open(self._filename(name) + '.meta', 'rb') as file_meta:
+            data = file_meta.read()
+        return pickle.loads(data) if data else {}
+
     def remove(self, name):
         basefilename = self._filename(name)
         file_data = basefilename + '.data'
@@ -63,6 +76,65 @@ class Storage:
         except OSError as e:
             logger.error("Could not delete file: {}\n {}".format(file_meta, str(e)))
             raise
+        for file_thumb in glob.glob(glob.escape(basefilename) + '.thumb.*'):
+            try:
+                os.remove(file_thumb)
+            except OSError as e:
+                # just a cache, not worth failing the removal for it
+                logger.warning("Could not delete file: {}\n {}".format(file_thumb, str(e)))
+
+    def get_thumbnail(self, name, thumbnail_type):
+        """
+        Return cached thumbnail data of item <name>, None if not cached yet.
+        """
+        try:
+            with open(self._thumbnail_filename(name, thumbnail_type), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_thumbnail(self, name, thumbnail_type, data):
+        """
+        Cache thumbnail data of item <name>.
+
+        The data is written to a temporary file first and then renamed, so
+        concurrent readers either see the complete thumbnail or none at all.
+        """
+        thumbnail_filename = self._thumbnail_filename(name, thumbnail_type)
+        fd, tmp_filename = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_filename, thumbnail_filename)
+        except OSError:
+            os.remove(tmp_filename)
+            raise
+
+    def remove_thumbnail(self, name, thumbnail_type):
+        """
+        Remove cached thumbnail data of item <name> (if any).
+        """
+        try:
+            os.remove(self._thumbnail_filename(name, thumbnail_type))
+        except FileNotFoundError:
+            pass
+
+    def version(self):
+        """
+        Return a string that changes whenever an item is created or removed
+        or its metadata is modified.
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.meta'):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    # removed concurrently, so it is not there any more anyway.
+                    continue
+                entries.append((entry.name, st.st_mtime_ns, st.st_size))
+        entries.sort()
+        return hashlib.sha1(repr(entries).encode(), usedforsecurity=False).hexdigest()
 
     def __iter__(self):
         names = [fn[:-5] for fn in os.listdir(self.directory)
@@ -113,6 +185,9 @@ class Data:
     def close(self):
         self._file.close()
 
+    def fileno(self):
+        return self._file.fileno()
+
     def read(self, size, offset):
         self._file.seek(offset)
         return self._file.read(size)
@@ -1,7 +1,9 @@
+import time
+
 import pytest
 
-from bepasty.constants import FOREVER
-from bepasty.utils.date_funcs import get_maxlife, time_unit_to_sec
+from bepasty.constants import FOREVER, TIMESTAMP_MAX_LIFE
+from bepasty.utils.date_funcs import get_maxlife, lifetime_over, time_unit_to_sec
 
 
 def test_get_maxlife():
@@ -20,3 +22,11 @@ def test_get_maxlife():
 ])
 def test_unit_to_secs(unit, expectation):
     assert time_unit_to_sec(1, unit) == expectation
+
+
+def test_lifetime_over():
+    now = int(time.time())
+    assert lifetime_over({TIMESTAMP_MAX_LIFE: now - 10})
+    assert not lifetime_over({TIMESTAMP_MAX_LIFE: now + 10})
+    assert not lifetime_over({TIMESTAMP_MAX_LIFE: FOREVER})
+    assert lifetime_over({TIMESTAMP_MAX_LIFE: now + 10}, now=now + 20)
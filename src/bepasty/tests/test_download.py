@@ -0,0 +1,227 @@
+#
+# download view tests
+#
+
+import errno
+import threading
+import time
+from collections import OrderedDict
+
+import pytest
+
+from ..app import create_app
+from ..config import Config
+from ..constants import TIMESTAMP_DOWNLOAD
+from ..utils.upload import Upload
+from ..views import download as download_views
+from ..views.download import ThumbnailView
+
+NAME = 'abcdefgh'
+DATA = b'0123456789' * 10
+IMAGE_NAME = 'bcdefghi'
+
+
+def create_item(app, name, data, filename, ct):
+    with app.test_request_context():
+        with app.storage.create(name, len(data)) as item:
+            item.data.write(data, 0)
+            Upload.meta_new(item, len(data), filename, ct, False, name)
+            Upload.meta_complete(item, '')
+
+
+@pytest.fixture
+def app(tmpdir, monkeypatch):
+    monkeypatch.setattr(Config, 'STORAGE_FILESYSTEM_DIRECTORY', str(tmpdir))
+    monkeypatch.setattr(Config, 'DEFAULT_PERMISSIONS', 'read')
+    monkeypatch.setattr(Config, 'SECRET_KEY', 'secret')
+    app = create_app()
+    create_item(app, NAME, DATA, 'data.bin', 'application/octet-stream')
+    return app
+
+
+def download(app, headers=None):
+    with app.test_client().get('/%s/+download' % NAME, headers=headers) as response:
+        return response.status_code, response.headers, response.get_data()
+
+
+def test_full(app):
+    status, headers, data = download(app)
+    assert status == 200
+    assert headers['Accept-Ranges'] == 'bytes'
+    assert 'Content-Range' not in headers
+    assert data == DATA
+
+
+def test_range(app):
+    status, headers, data = download(app, {'Range': 'bytes=10-19'})
+    assert status == 206
+    assert headers['Content-Range'] == 'bytes 10-19/%d' % len(DATA)
+    assert data == DATA[10:20]
+
+
+def test_range_open_ended(app):
+    status, headers, data = download(app, {'Range': 'bytes=90-'})
+    assert status == 206
+    assert headers['Content-Range'] == 'bytes 90-99/%d' % len(DATA)
+    assert data == DATA[90:]
+
+
+def test_range_not_satisfiable(app):
+    status, headers, data = download(app, {'Range': 'bytes=100-'})
+    assert status == 416
+    assert headers['Content-Range'] == 'bytes */%d' % len(DATA)
+
+
+def test_range_invalid(app):
+    # an invalid Range header is ignored, the client gets the whole item
+    status, headers, data = download(app, {'Range': 'bytes=foo'})
+    assert status == 200
+    assert data == DATA
+
+
+def test_not_modified(app, monkeypatch):
+    status, headers, data = download(app)
+    etag = headers['ETag']
+
+    def openwrite(name):
+        raise AssertionError('storage must not be accessed')
+
+    monkeypatch.setattr(app.storage, 'openwrite', openwrite)
+    status, headers, data = download(app, {'If-None-Match': etag})
+    assert status == 304
+    assert headers['ETag'] == etag
+    assert data == b''
+
+
+def test_timestamp_download(app):
+    assert app.storage.read_meta(NAME)[TIMESTAMP_DOWNLOAD] == 0
+    # range requests (e.g. from a video player) do not count as downloads
+    download(app, {'Range': 'bytes=10-19'})
+    assert app.storage.read_meta(NAME)[TIMESTAMP_DOWNLOAD] == 0
+    download(app)
+    assert app.storage.read_meta(NAME)[TIMESTAMP_DOWNLOAD] > 0
+
+
+class Generator:
+    """
+    replaces the image thumbnail generation, blocks until released.
+    """
+    def __init__(self, result=b'thumbnail'):
+        self.result = result
+        self.calls = 0
+        self.released = threading.Event()
+
+    def __call__(self, item, sz, thumbnail_type):
+        self.calls += 1
+        self.released.wait(5)
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def wait_for(condition):
+    for _ in range(100):
+        if condition():
+            break
+        time.sleep(0.01)
+    assert condition()
+
+
+@pytest.fixture
+def generator(app, monkeypatch):
+    create_item(app, IMAGE_NAME, b'image', 'image.png', 'image/png')
+    monkeypatch.setattr(download_views, 'PIL', True)
+    monkeypatch.setattr(download_views, 'thumbnail_jobs', {})
+    monkeypatch.setattr(download_views, 'thumbnail_failures', OrderedDict())
+    monkeypatch.setattr(ThumbnailView, 'thumbnail_timeout', 0.01)
+    generator = Generator()
+    monkeypatch.setattr(ThumbnailView, '_generate_image_thumbnail', staticmethod(generator))
+    yield generator
+    generator.released.set()
+
+
+def thumbnail(app):
+    with app.test_client().get('/%s/+thumbnail' % IMAGE_NAME) as response:
+        return response.status_code, response.headers, response.get_data()
+
+
+def test_thumbnail_pending(app, generator):
+    status, headers, data = thumbnail(app)
+    assert status == 200
+    assert headers['Content-Type'] == 'image/svg+xml'
+    assert headers['Cache-Control'] == 'no-store, must-revalidate'
+    assert headers['Retry-After'] == '2'
+    assert 'ETag' not in headers
+    # the running job is reused
+    thumbnail(app)
+    assert generator.calls == 1
+    future = download_views.thumbnail_jobs[IMAGE_NAME, 'png']
+    generator.released.set()
+    future.result()
+    wait_for(lambda: not download_views.thumbnail_jobs)
+    status, headers, data = thumbnail(app)
+    assert status == 200
+    assert headers['Content-Type'] == 'image/png'
+    assert headers['ETag'] == '"%s-thumb"' % IMAGE_NAME
+    assert data == b'thumbnail'
+    # served from the cache
+    assert app.storage.get_thumbnail(IMAGE_NAME, 'png') == b'thumbnail'
+    assert generator.calls == 1
+
+
+def test_thumbnail_failed(app, generator, monkeypatch):
+    generator.result = ValueError('corrupt image')
+    generator.released.set()
+    monkeypatch.setattr(ThumbnailView, 'thumbnail_timeout', 5)
+    status, headers, data = thumbnail(app)
+    assert status == 200
+    assert headers['Content-Type'] == 'image/svg+xml'
+    assert headers['Cache-Control'] == 'no-store, must-revalidate'
+    assert 'ETag' not in headers
+    assert 'Retry-After' not in headers
+    wait_for(lambda: not download_views.thumbnail_jobs)
+    assert (IMAGE_NAME, 'png') in download_views.thumbnail_failures
+    # not tried again for a while
+    status, headers, data = thumbnail(app)
+    assert headers['Cache-Control'] == 'no-store, must-revalidate'
+    assert generator.calls == 1
+
+
+def test_thumbnail_cache_write_failed(app, generator, monkeypatch):
+    def put_thumbnail(name, thumbnail_type, data):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    monkeypatch.setattr(app.storage, 'put_thumbnail', put_thumbnail)
+    generator.released.set()
+    monkeypatch.setattr(ThumbnailView, 'thumbnail_timeout', 5)
+    status, headers, data = thumbnail(app)
+    assert headers['Content-Type'] == 'image/png'
+    assert data == b'thumbnail'
+    wait_for(lambda: not download_views.thumbnail_jobs)
+    assert not download_views.thumbnail_failures
+
+
+def test_thumbnail_item_removed(app, generator, tmpdir):
+    thumbnail(app)
+    future = download_views.thumbnail_jobs[IMAGE_NAME, 'png']
+    app.storage.remove(IMAGE_NAME)
+    generator.released.set()
+    future.result()
+    assert tmpdir.listdir(lambda p: IMAGE_NAME in p.basename) == []
+
+
+def test_thumbnail_item_closed(app, generator, monkeypatch):
+    items = []
+    openwrite = app.storage.openwrite
+
+    def openwrite_recorded(name):
+        item = openwrite(name)
+        items.append(item)
+        return item
+
+    monkeypatch.setattr(app.storage, 'openwrite', openwrite_recorded)
+    thumbnail(app)
+    generator.released.set()
+    thumbnail(app)
+    assert len(items) == 2
+    assert all(item.meta._file.closed for item in items)
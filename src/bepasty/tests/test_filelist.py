@@ -0,0 +1,72 @@
+import pytest
+
+from bepasty.app import create_app
+from bepasty.config import Config
+from bepasty.utils.upload import Upload
+from bepasty.views import filelist
+from bepasty.views.filelist import RenderCache, sizeof_fmt
+
+
+@pytest.mark.parametrize('num,expectation', [
+    (0, '0.0B'),
+    (5, '5.0B'),
+    (1023, '1023.0B'),
+    (1024, '1.0KiB'),
+    (1536, '1.5KiB'),
+    (1024 * 1024, '1.0MiB'),
+    (5 * 1000 * 1000 * 1000, '4.7GiB'),
+    (1024 ** 8, '1.0YiB'),
+    (1024 ** 9, '1024.0YiB'),
+])
+def test_sizeof_fmt(num, expectation):
+    assert sizeof_fmt(num) == expectation
+
+
+@pytest.fixture
+def app(tmpdir, monkeypatch):
+    monkeypatch.setattr(Config, 'STORAGE_FILESYSTEM_DIRECTORY', str(tmpdir))
+    monkeypatch.setattr(Config, 'DEFAULT_PERMISSIONS', 'list')
+    monkeypatch.setattr(Config, 'SECRET_KEY', 'secret')
+    monkeypatch.setattr(filelist, 'filelist_cache', RenderCache(maxsize=16))
+    return create_app()
+
+
+def create_item(app, name):
+    data = b'data'
+    with app.test_request_context():
+        with app.storage.create(name, len(data)) as item:
+            item.data.write(data, 0)
+            Upload.meta_new(item, len(data), name + '.txt', 'text/plain', False, name)
+            Upload.meta_complete(item, '')
+
+
+def test_filelist_not_modified(app):
+    create_item(app, 'abcdefgh')
+    client = app.test_client()
+    response = client.get('/+list')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    response = client.get('/+list', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.headers['ETag'] == etag
+
+
+def test_filelist_changed(app):
+    create_item(app, 'abcdefgh')
+    client = app.test_client()
+    response = client.get('/+list')
+    etag = response.headers['ETag']
+    assert b'abcdefgh.txt' in response.data
+    # a new item invalidates the cached list
+    create_item(app, 'bcdefghi')
+    response = client.get('/+list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'bcdefghi.txt' in response.data
+    etag = response.headers['ETag']
+    # and so does removing one
+    app.storage.remove('abcdefgh')
+    response = client.get('/+list', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert b'abcdefgh.txt' not in response.data
@@ -1,3 +1,5 @@
+import os
+
 import pytest
 
 from bepasty.storage.filesystem import Storage
@@ -35,3 +37,72 @@ def test_invalid_name(tmpdir):
     name = "../invalid"
     with pytest.raises(RuntimeError):
         storage.create(name, 0)
+
+
+def test_thumbnail(tmpdir):
+    storage = Storage(str(tmpdir))
+    name = "foo"
+    with storage.create(name, 0):
+        pass
+    # nothing cached yet
+    assert storage.get_thumbnail(name, "png") is None
+    storage.put_thumbnail(name, "png", b"thumbnail")
+    assert storage.get_thumbnail(name, "png") == b"thumbnail"
+    # different thumbnail types are cached separately
+    assert storage.get_thumbnail(name, "jpeg") is None
+    # thumbnails are not items
+    assert list(storage) == [name]
+    # removing the item also removes its thumbnails
+    storage.remove(name)
+    assert storage.get_thumbnail(name, "png") is None
+    assert tmpdir.listdir() == []
+
+
+def test_version(tmpdir):
+    storage = Storage(str(tmpdir))
+    v0 = storage.version()
+    assert storage.version() == v0
+    name = "foo"
+    with storage.create(name, 0):
+        pass
+    v1 = storage.version()
+    assert v1 != v0
+    # metadata changes are noticed, too
+    with storage.openwrite(name) as item:
+        item.meta["key"] = "value"
+    assert storage.version() != v1
+    storage.remove(name)
+    assert storage.version() == v0
+
+
+def test_version_concurrent_remove(tmpdir, monkeypatch):
+    storage = Storage(str(tmpdir))
+    for name in ["foo", "bar"]:
+        with storage.create(name, 0):
+            pass
+    scandir = os.scandir
+
+    def scandir_then_remove(path):
+        # the directory is listed, then an item is removed before its stat
+        entries = list(scandir(path))
+        storage.remove("bar")
+        return entries
+
+    monkeypatch.setattr(os, 'scandir', scandir_then_remove)
+    v = storage.version()
+    monkeypatch.undo()
+    assert storage.version() == v
+
+
+def test_read_meta(tmpdir):
+    storage = Storage(str(tmpdir))
+    name = "foo"
+    with storage.create(name, 0):
+        pass
+    # 0-byte .meta file
+    assert storage.read_meta(name) == {}
+    with storage.openwrite(name) as item:
+        item.meta["key"] = "value"
+    assert storage.read_meta(name) == {"key": "value"}
+    with pytest.raises(FileNotFoundError):
+        storage.read_meta("bar")
@@ -42,11 +42,22 @@ def time_unit_to_sec(value, unit):
     return secs
 
 
-def delete_if_lifetime_over(item, name):
+def lifetime_over(meta, now=None):
     """
+    :param now: current time, pass it in when checking many items
+    :return: True if the lifetime of the item with metadata <meta> is over
+    """
+    if now is None:
+        now = time.time()
+    return 0 < meta[TIMESTAMP_MAX_LIFE] < now
+
+
+def delete_if_lifetime_over(item, name, now=None):
+    """
+    :param now: current time, pass it in when checking many items
     :return: True if file was deleted
     """
-    if 0 < item.meta[TIMESTAMP_MAX_LIFE] < time.time():
+    if lifetime_over(item.meta, now):
         try:
             current_app.storage.remove(name)
         except OSError:
@@ -1,6 +1,12 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import errno
+from functools import lru_cache, partial
+import io
 from io import BytesIO
+import logging
 import os
+import threading
 import time
 
 try:
@@ -9,7 +15,7 @@ except ImportError:
     # Pillow / PIL is optional
     PIL = None
 else:
-    from PIL import Image
+    from PIL import Image, features
 
 try:
     import av  # for video thumbnail generation
@@ -19,17 +25,216 @@ except ImportError:
 else:
     from av import VideoFrame
 
-from flask import Response, current_app, render_template, stream_with_context
+from flask import Response, current_app, render_template, request
 from flask.views import MethodView
-from werkzeug.exceptions import NotFound, Forbidden
+from werkzeug.exceptions import BadRequest, NotFound, Forbidden
+from werkzeug.wsgi import wrap_file
 
 from ..constants import COMPLETE, FILENAME, LOCKED, SIZE, TIMESTAMP_DOWNLOAD, TYPE
 from ..utils.date_funcs import delete_if_lifetime_over
+from ..utils.http import DownloadRange
 from ..utils.permissions import ADMIN, READ, may
 
+logger = logging.getLogger(__name__)
+
+if PIL and not features.check_feature('libjpeg_turbo'):
+    # stock libjpeg works, but decodes JPEGs considerably slower than
+    # libjpeg-turbo (which the official Pillow wheels are built against).
+    logger.warning("Pillow is not linked against libjpeg-turbo, JPEG thumbnail generation will be slow.")
+
+
+# image content type -> thumbnail type generated by Pillow
+IMAGE_THUMBNAIL_TYPES = {
+    'image/jpeg': 'jpeg',
+    'image/png': 'png',
+    'image/gif': 'png',
+    'image/webp': 'webp',
+    'image/bmp': 'bmp',
+}
+
+PLACEHOLDER_PREFIX = b"""\
+<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg width="108" height="108" viewBox="0 0 108 108" xmlns="http://www.w3.org/2000/svg">
+<rect x="1" y="1" width="106" height="106" fill="whitesmoke" stroke-width="2" stroke="blue" />
+    <line x1="1" y1="1" x2="106" y2="106" stroke="blue" stroke-width="2" />
+    <line x1="1" y1="106" x2="106" y2="0" stroke="blue" stroke-width="2" />
+    <rect x="10" y="40" width="88" height="24" fill="whitesmoke" fill-opacity="0.9"/>
+    <text x="50%" y="50%" text-anchor="middle" dominant-baseline="middle" font-family="Arial, sans-serif" \
+font-size="18" fill="blue" lengthAdjust="spacingAndGlyphs" textLength="90">"""
+
+PLACEHOLDER_SUFFIX = b"""</text>
+
+</svg>"""
+
+
+TXT_THUMBNAIL_PREFIX = b"""\
+<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg width="108" height="108" viewBox="0 0 108 108" xmlns="http://www.w3.org/2000/svg">
+<rect x="1" y="1" width="106" height="106" fill="white" stroke-width="2" stroke="gray" />
+<foreignObject x="4" y="4" width="100" height="100">
+<div xmlns="http://www.w3.org/1999/xhtml" style="font-family: monospace; font-size: 8px; line-height: 1.2; \
+overflow: hidden; white-space: pre-wrap; word-wrap: break-word;">
+"""
+
+TXT_THUMBNAIL_SUFFIX = b"""
+</div>
+</foreignObject>
+</svg>"""
+
+# escape XML special characters in a single pass
+XML_ESCAPE = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+
+
+@lru_cache(maxsize=64)
+def placeholder_thumbnail(mimetype):
+    """Placeholder thumbnail SVG with the mimetype displayed."""
+    return PLACEHOLDER_PREFIX + mimetype.encode('ascii', 'replace') + PLACEHOLDER_SUFFIX
+
+
+# thumbnails are generated in a few background threads, so a slow decode
+# does not block the request handling.
+THUMBNAIL_WORKERS = 4
+thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix='thumbnail')
+# (name, thumbnail type) -> Future, for the thumbnails currently generated
+thumbnail_jobs = {}
+# (name, thumbnail type) -> time, for the thumbnails that could not be
+# generated recently, so we do not decode e.g. a corrupt image again and again.
+THUMBNAIL_FAILURE_TTL = 600
+THUMBNAIL_FAILURES_MAX = 1000
+thumbnail_failures = OrderedDict()
+thumbnail_jobs_lock = threading.Lock()
+
+
+def make_thumbnail(storage, name, thumbnail_type, generate):
+    """
+    generate a thumbnail with generate(item) and put it into the storage's
+    thumbnail cache.
+
+    be careful: this runs in a worker thread, do not access flask threadlocals!
+    """
+    with storage.open(name) as item:
+        thumbnail_data = generate(item)
+    try:
+        storage.put_thumbnail(name, thumbnail_type, thumbnail_data)
+    except OSError as e:
+        # just a cache, we can still serve the thumbnail we have generated
+        logger.warning("Could not cache thumbnail for %s (%s): %s", name, thumbnail_type, e)
+    else:
+        if name not in storage:
+            # the item was removed meanwhile, together with its thumbnails -
+            # except the one we have just put there.
+            storage.remove_thumbnail(name, thumbnail_type)
+    return thumbnail_data
+
+
+def submit_thumbnail(storage, name, thumbnail_type, generate):
+    """
+    start generating a thumbnail in the background (unless that is already
+    in progress), return the Future of the thumbnail data.
+
+    return None if generating this thumbnail has failed recently.
+    """
+    key = name, thumbnail_type
+    with thumbnail_jobs_lock:
+        failed = thumbnail_failures.get(key)
+        if failed is not None:
+            if failed + THUMBNAIL_FAILURE_TTL > time.time():
+                return None
+            del thumbnail_failures[key]
+        future = thumbnail_jobs.get(key)
+        if future is None:
+            future = thumbnail_executor.submit(make_thumbnail, storage, name, thumbnail_type, generate)
+            thumbnail_jobs[key] = future
+            created = True
+        else:
+            created = False
+    if created:
+        # not under the lock: the callback runs right here if the job is already done
+        future.add_done_callback(partial(thumbnail_done, key))
+    return future
+
+
+def thumbnail_done(key, future):
+    """
+    forget a finished thumbnail job, remember (for a while) if it failed.
+    """
+    exc = future.exception()
+    if exc is not None:
+        logger.error("Could not generate thumbnail for %s (%s)", key[0], key[1],
+                     exc_info=(type(exc), exc, exc.__traceback__))
+    with thumbnail_jobs_lock:
+        if thumbnail_jobs.get(key) is future:
+            del thumbnail_jobs[key]
+        if exc is not None:
+            thumbnail_failures[key] = time.time()
+            thumbnail_failures.move_to_end(key)
+            if len(thumbnail_failures) > THUMBNAIL_FAILURES_MAX:
+                thumbnail_failures.popitem(last=False)
+
+
+class DataFile(io.RawIOBase):
+    """
+    Read-only, seekable file-like object on top of item data, which itself
+    only offers read(size, offset).
+
+    :param data: item data
+    :param size: size of item data
+    :param on_close: optional callable, called once when the file gets closed
+    """
+    def __init__(self, data, size, on_close=None):
+        super().__init__()
+        self._data = data
+        self._size = size
+        self._pos = 0
+        self._on_close = on_close
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f'invalid whence ({whence})')
+        if pos < 0:
+            raise ValueError(f'negative seek position {pos}')
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        buf = self._data.read(max(0, min(len(b), self._size - self._pos)), self._pos)
+        n = len(buf)
+        b[:n] = buf
+        self._pos += n
+        return n
+
+    def fileno(self):
+        if not hasattr(self._data, 'fileno'):
+            raise io.UnsupportedOperation('fileno')
+        fd = self._data.fileno()
+        # sendfile(2) based file wrappers start at the current file offset
+        os.lseek(fd, self._pos, os.SEEK_SET)
+        return fd
+
+    def close(self):
+        if not self.closed and self._on_close is not None:
+            self._on_close()
+        super().close()
+
 
 class DownloadView(MethodView):
     content_disposition = 'attachment'  # to trigger download
+    buffer_size = 64 * 1024
 
     def err_incomplete(self, item, error):
         return render_template('error.html', heading=item.meta[FILENAME], body=error), 409
@@ -39,33 +244,84 @@ class DownloadView(MethodView):
             # Stream content from storage
             offset = max(0, start)
             while offset < limit:
-                buf = _item.data.read(min(limit - offset, 16 * 1024), offset)
+                buf = _item.data.read(min(limit - offset, self.buffer_size), offset)
                 offset += len(buf)
                 yield buf
             item.meta[TIMESTAMP_DOWNLOAD] = int(time.time())
 
+    def finish(self, item):
+        with item:
+            item.meta[TIMESTAMP_DOWNLOAD] = int(time.time())
+
+    def etag(self, name):
+        """
+        ETag of the response for item <name>, None if there is none.
+        """
+        return f'"{name}"'
+
+    def not_modified(self, etag):
+        return Response(status=304, headers=[
+            ('Cache-Control', 'public, max-age=31536000, immutable'),
+            ('ETag', etag),
+        ])
+
     def response(self, item, name):
-        ct = item.meta[TYPE]
+        meta = dict(item.meta)
+        ct = meta[TYPE]
         dispo = self.content_disposition
         if dispo != 'attachment':
             # no simple download, so we must be careful about XSS
             if ct.startswith("text/"):
                 ct = 'text/plain'  # only send simple plain text
 
-        ret = Response(stream_with_context(self.stream(item, 0, item.data.size)))
-        ret.headers['Content-Disposition'] = '{}; filename="{}"'.format(
-            dispo, item.meta[FILENAME])
-        ret.headers['Content-Length'] = item.meta[SIZE]
-        ret.headers['Content-Type'] = ct
-        ret.headers['X-Content-Type-Options'] = 'nosniff'  # yes, we really mean it
-        # Cache headers - files never change
-        ret.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
-        ret.headers['ETag'] = f'"{name}"'
-        return ret
+        size = item.data.size
+        try:
+            request_range = DownloadRange.from_request()
+        except BadRequest:
+            # a server may ignore an invalid Range header and send everything
+            request_range = None
+        range_begin, range_end = 0, size - 1
+        if request_range is not None:
+            if request_range.begin >= size:
+                item.close()
+                return Response(status=416, headers=[('Content-Range', 'bytes */%d' % size)])
+            range_begin = request_range.begin
+            if request_range.end != -1:
+                range_end = min(request_range.end, size - 1)
+
+        headers = [
+            ('Accept-Ranges', 'bytes'),
+            ('Content-Disposition', '{}; filename="{}"'.format(dispo, meta[FILENAME])),
+            ('Content-Length', range_end - range_begin + 1),
+            ('Content-Type', ct),
+            ('X-Content-Type-Options', 'nosniff'),  # yes, we really mean it
+            # Cache headers - files never change
+            ('Cache-Control', 'public, max-age=31536000, immutable'),
+            ('ETag', self.etag(name)),
+        ]
+        if request_range is not None:
+            status = 206
+            headers.append(('Content-Range', 'bytes %d-%d/%d' % (range_begin, range_end, size)))
+        else:
+            status = 200
+
+        # only a GET of the whole item is a download. not a HEAD request, which
+        # does not transfer the file, nor a range request (e.g. from a video
+        # player), it would rewrite the metadata for every chunk.
+        on_close = partial(self.finish, item) if status == 200 and request.method == 'GET' else item.close
+        fileobj = DataFile(item.data, range_end + 1, on_close=on_close)
+        fileobj.seek(range_begin)
+        # the WSGI server's file wrapper (if any) may send the file via sendfile(2)
+        return Response(wrap_file(request.environ, fileobj, self.buffer_size), status=status, headers=headers,
+                        direct_passthrough=True)
 
     def get(self, name):
         if not may(READ):
             raise Forbidden()
+        etag = self.etag(name)
+        if etag is not None and request.headers.get('If-None-Match') == etag:
+            # items never change, no need to even open it
+            return self.not_modified(etag)
         try:
             item = current_app.storage.openwrite(name)
         except OSError as e:
@@ -97,121 +353,147 @@ class InlineView(DownloadView):
 
 class ThumbnailView(InlineView):
     thumbnail_size = 192, 108
+    # how long a request waits for a thumbnail before it gets a placeholder
+    thumbnail_timeout = 0.05
+    # SVGs are sent as their own thumbnail, but not if they are that big
+    svg_thumbnail_max_size = 1024 * 1024
 
     def _generate_placeholder_thumbnail(self, mimetype):
         """Generate a placeholder thumbnail SVG with the mimetype displayed."""
-        return f"""\
-<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-<svg width="108" height="108" viewBox="0 0 108 108" xmlns="http://www.w3.org/2000/svg">
-<rect x="1" y="1" width="106" height="106" fill="whitesmoke" stroke-width="2" stroke="blue" />
-    <line x1="1" y1="1" x2="106" y2="106" stroke="blue" stroke-width="2" />
-    <line x1="1" y1="106" x2="106" y2="0" stroke="blue" stroke-width="2" />
-    <rect x="10" y="40" width="88" height="24" fill="whitesmoke" fill-opacity="0.9"/>
-    <text x="50%" y="50%" text-anchor="middle" dominant-baseline="middle" font-family="Arial, sans-serif" font-size="18" fill="blue" lengthAdjust="spacingAndGlyphs" textLength="90">{mimetype}</text>
-
-</svg>""".strip().encode()
+        return placeholder_thumbnail(mimetype)
 
     def err_incomplete(self, item, error):
         return b'', 409  # conflict
 
     def _generate_image_thumbnail(self, item, sz, thumbnail_type):
         """Generate thumbnail data for supported image types."""
-        with BytesIO(item.data.read(sz, 0)) as img_bio, BytesIO() as thumbnail_bio:
-            with Image.open(img_bio) as img:
+        # Pillow reads the image through the (buffered) file-like object as
+        # needed, so we do not need to load the whole image into memory.
+        with io.BufferedReader(DataFile(item.data, sz), self.buffer_size) as img_file, BytesIO() as thumbnail_bio:
+            with Image.open(img_file) as img:
+                # for JPEGs, thumbnail() already lets the decoder scale down
+                # (draft mode), keeping reducing_gap for the resize quality.
                 img.thumbnail(self.thumbnail_size)
                 img.save(thumbnail_bio, thumbnail_type)
             return thumbnail_bio.getvalue()
+
     def _generate_video_thumbnail(self, item, sz):
         """Generate thumbnail data for video types."""
-        with BytesIO(item.data.read(sz, 0)) as video_bio, BytesIO() as thumbnail_bio:
-            container = av.open(video_bio)
-            stream = container.streams.video[0]
-            frame = next(container.decode(stream))
-            frame = frame.to_image()
+        # av reads (and seeks) through the file-like object on demand, so we
+        # do not need to load the whole video into memory.
+        with DataFile(item.data, sz) as video_file, BytesIO() as thumbnail_bio:
+            with av.open(video_file) as container:
+                stream = container.streams.video[0]
+                # we only want a keyframe, no need to decode anything else
+                stream.codec_context.skip_frame = 'NONKEY'
+                stream.thread_type = 'AUTO'
+                if stream.duration:
+                    # the very first frames are often black, seek a bit into the video
+                    offset = (stream.start_time or 0) + int(stream.duration * 0.1)
+                    try:
+                        container.seek(offset, stream=stream)
+                    except av.FFmpegError:
+                        pass
+                frame = next(container.decode(stream))
+                frame = frame.to_image()
             frame.thumbnail(self.thumbnail_size)
             frame.save(thumbnail_bio, 'jpeg')
             return thumbnail_bio.getvalue()
+
     def _generate_txt_thumbnail(self, item, sz):
         """Generate a thumbnail for text files."""
-        with BytesIO(item.data.read(min(sz, 1024), 0)) as txt_bio:
-            content = txt_bio.read().decode('utf-8', errors='replace')
-            # Take first few lines and limit characters
-            lines = content.split('\n')[:6]
-            preview_text = '\n'.join(line[:30] + ('...' if len(line) > 30 else '') for line in lines)
-            
-            # Escape XML special characters
-            preview_text = preview_text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-            
-            return f"""\
-<?xml version="1.0" encoding="UTF-8" standalone="no"?>
-<svg width="108" height="108" viewBox="0 0 108 108" xmlns="http://www.w3.org/2000/svg">
-<rect x="1" y="1" width="106" height="106" fill="white" stroke-width="2" stroke="gray" />
-<foreignObject x="4" y="4" width="100" height="100">
-<div xmlns="http://www.w3.org/1999/xhtml" style="font-family: monospace; font-size: 8px; line-height: 1.2; overflow: hidden; white-space: pre-wrap; word-wrap: break-word;">
-{preview_text}
-</div>
-</foreignObject>
-</svg>""".strip().encode()
+        content = item.data.read(min(sz, 1024), 0).decode('utf-8', errors='replace')
+        # Take first few lines and limit characters
+        lines = content.split('\n', 6)[:6]
+        preview_text = '\n'.join(line[:30] + ('...' if len(line) > 30 else '') for line in lines)
+        return TXT_THUMBNAIL_PREFIX + preview_text.translate(XML_ESCAPE).encode() + TXT_THUMBNAIL_SUFFIX
+
+    def etag(self, name):
+        return f'"{name}-thumb"'
+
+    def placeholder_response(self, ct, etag=None, retry_after=None):
+        """
+        placeholder thumbnail - without an etag, it is only a temporary one
+        (e.g. the real thumbnail is not there yet), so the client must not cache it.
+        """
+        thumbnail_data = self._generate_placeholder_thumbnail(ct)
+        headers = [
+            ('Content-Length', len(thumbnail_data)),
+            ('Content-Type', 'image/svg+xml'),
+            ('X-Content-Type-Options', 'nosniff'),  # yes, we really mean it
+        ]
+        if etag is not None:
+            headers += [
+                ('Cache-Control', 'public, max-age=31536000, immutable'),
+                ('ETag', etag),
+            ]
+        else:
+            headers.append(('Cache-Control', 'no-store, must-revalidate'))
+        if retry_after is not None:
+            headers.append(('Retry-After', retry_after))
+        return Response(thumbnail_data, headers=headers)
+
+    def thumbnail_headers(self, meta, thumbnail_type, size, etag):
+        base, ext = os.path.splitext(meta[FILENAME])
+        thumbnail_fn = '{}-thumb.{}'.format(base, thumbnail_type)
+        return [
+            ('Content-Disposition', '{}; filename="{}"'.format(self.content_disposition, thumbnail_fn)),
+            ('Content-Length', size),
+            ('Content-Type', 'image/%s' % thumbnail_type),
+            ('X-Content-Type-Options', 'nosniff'),  # yes, we really mean it
+            # Cache headers - thumbnails never change
+            ('Cache-Control', 'public, max-age=31536000, immutable'),
+            ('ETag', etag),
+        ]
 
     def response(self, item, name):
-        sz = item.meta[SIZE]
-        fn = item.meta[FILENAME]
-        ct = item.meta[TYPE]
+        etag = self.etag(name)
+        meta = dict(item.meta)
+        sz = meta[SIZE]
+        ct = meta[TYPE]
         if not PIL:
             # return a placeholder thumbnail for unsupported item types
-            thumbnail_data = self._generate_placeholder_thumbnail(ct)
-            ret = Response(thumbnail_data)
-            ret.headers['Content-Length'] = len(thumbnail_data)
-            ret.headers['Content-Type'] = 'image/svg+xml'
-            ret.headers['X-Content-Type-Options'] = 'nosniff'
-            ret.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
-            ret.headers['ETag'] = f'"{name}-thumb"'
-            return ret
-
-        match ct:
-            case 'image/jpeg':
-                thumbnail_type = 'jpeg'
-                thumbnail_data = self._generate_image_thumbnail(item, sz, thumbnail_type)
-            case 'image/png' | 'image/gif':
-                thumbnail_type = 'png'
-                thumbnail_data = self._generate_image_thumbnail(item, sz, thumbnail_type)
-            case 'image/webp':
-                thumbnail_type = 'webp'
-                thumbnail_data = self._generate_image_thumbnail(item, sz, thumbnail_type)
-            case 'image/bmp':
-                thumbnail_type = 'bmp'
-                thumbnail_data = self._generate_image_thumbnail(item, sz, thumbnail_type)
-            case 'image/svg+xml':
-                thumbnail_type = 'svg+xml'
-                # Return SVG directly without processing
-                thumbnail_data = item.data.read(sz, 0)
-            case 'video/mp4':
-                thumbnail_type = 'mp4'
-                thumbnail_data = self._generate_video_thumbnail(item, sz)
-            case ct if ct.startswith('text/'):
-                thumbnail_type = 'svg+xml'
-                thumbnail_data = self._generate_txt_thumbnail(item, sz)
-            case _:
-                # return a placeholder thumbnail for unsupported item types
-                thumbnail_data = self._generate_placeholder_thumbnail(ct)
-                ret = Response(thumbnail_data)
-                ret.headers['Content-Length'] = len(thumbnail_data)
-                ret.headers['Content-Type'] = 'image/svg+xml'
-                ret.headers['X-Content-Type-Options'] = 'nosniff'  # yes, we really mean it
-                ret.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
-                ret.headers['ETag'] = f'"{name}-thumb"'
-                return ret
-
-        name, ext = os.path.splitext(fn)
-        thumbnail_fn = '{}-thumb.{}'.format(name, thumbnail_type)
-
-        ret = Response(thumbnail_data)
-        ret.headers['Content-Disposition'] = '{}; filename="{}"'.format(
-            self.content_disposition, thumbnail_fn)
-        ret.headers['Content-Length'] = len(thumbnail_data)
-        ret.headers['Content-Type'] = 'image/%s' % thumbnail_type
-        ret.headers['X-Content-Type-Options'] = 'nosniff'  # yes, we really mean it
-        # Cache headers - thumbnails never change
-        ret.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
-        ret.headers['ETag'] = f'"{name}-thumb"'
-        return ret
+            item.close()
+            return self.placeholder_response(ct, etag)
+
+        thumbnail_type = IMAGE_THUMBNAIL_TYPES.get(ct)
+        if thumbnail_type is not None:
+            generate = partial(self._generate_image_thumbnail, sz=sz, thumbnail_type=thumbnail_type)
+        elif ct == 'image/svg+xml':
+            if sz > self.svg_thumbnail_max_size:
+                item.close()
+                return self.placeholder_response(ct, etag)
+            # Return SVG directly without processing
+            fileobj = DataFile(item.data, sz, on_close=item.close)
+            return Response(wrap_file(request.environ, fileobj, self.buffer_size),
+                            headers=self.thumbnail_headers(meta, 'svg+xml', sz, etag),
+                            direct_passthrough=True)
+        elif ct == 'video/mp4' and av:
+            thumbnail_type = 'jpeg'
+            generate = partial(self._generate_video_thumbnail, sz=sz)
+        elif ct.startswith('text/'):
+            thumbnail_type = 'svg+xml'
+            generate = partial(self._generate_txt_thumbnail, sz=sz)
+        else:
+            # return a placeholder thumbnail for unsupported item types
+            item.close()
+            return self.placeholder_response(ct, etag)
+
+        # the thumbnail is generated from a separately opened item in a worker thread
+        item.close()
+        storage = current_app.storage
+        thumbnail_data = storage.get_thumbnail(name, thumbnail_type)
+        if thumbnail_data is None:
+            future = submit_thumbnail(storage, name, thumbnail_type, generate)
+            if future is None:
+                # failed recently, maybe we have more luck later
+                return self.placeholder_response(ct)
+            try:
+                thumbnail_data = future.result(timeout=self.thumbnail_timeout)
+            except TimeoutError:
+                # the real thumbnail is not there yet
+                return self.placeholder_response(ct, retry_after=2)
+            except Exception:
+                # already logged by thumbnail_done
+                return self.placeholder_response(ct)
+        return Response(thumbnail_data, headers=self.thumbnail_headers(meta, thumbnail_type, len(thumbnail_data), etag))
@@ -1,20 +1,54 @@
 import errno
+import hashlib
+import math
 import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-from flask import current_app, render_template
+from flask import Response, current_app, render_template, request, url_for
+from flask import g as flaskg
 from flask.views import MethodView
 from werkzeug.exceptions import Forbidden
 
-from ..constants import ID, SIZE, TIMESTAMP_UPLOAD
-from ..utils.date_funcs import delete_if_lifetime_over
+from ..constants import ID, SIZE, TIMESTAMP_MAX_LIFE, TIMESTAMP_UPLOAD
+from ..utils.date_funcs import lifetime_over
 from ..utils.permissions import LIST, may
 
+# number of threads used to load the metadata of storage items
+FILE_INFOS_WORKERS = 32
+file_infos_executor = ThreadPoolExecutor(max_workers=FILE_INFOS_WORKERS, thread_name_prefix='file_infos')
+
+
+SIZE_UNITS = ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi", "Yi")
+SIZE_DIVISORS = tuple(1 << (10 * idx) for idx in range(len(SIZE_UNITS)))
+
+
 def sizeof_fmt(num, suffix="B"):
-    for unit in ("", "Ki", "Mi", "Gi", "Ti", "Pi", "Ei", "Zi"):
-        if abs(num) < 1024.0:
-            return f"{num:3.1f}{unit}{suffix}"
-        num /= 1024.0
-    return f"{num:.1f}Yi{suffix}"
+    # every unit is 10 bits more than the previous one.
+    # num | 1 has the same bit length as num, except for 0.
+    idx = ((num | 1).bit_length() - 1) // 10
+    if idx >= len(SIZE_UNITS):
+        idx = len(SIZE_UNITS) - 1
+    return f"{num / SIZE_DIVISORS[idx]:3.1f}{SIZE_UNITS[idx]}{suffix}"
+
+
+def file_info(storage, name):
+    """
+    return (name, metadata) of storage item <name>, metadata is None if
+    there is no usable item.
+    """
+    try:
+        return name, storage.read_meta(name)
+    except OSError as e:
+        if e.errno != errno.ENOENT:
+            raise
+    except pickle.UnpicklingError:
+        # corrupted meta file, just ignore it for now
+        pass
+    return name, None
 
 
 def file_infos(names=None):
@@ -22,37 +56,107 @@ def file_infos(names=None):
     iterates over storage files metadata.
     note: we put the storage name into the metadata as ID
 
+    the items are opened in parallel by a pool of threads, as this is
+    mostly waiting for I/O. results are yielded in order of names.
+    items whose lifetime is over are skipped and removed at the end.
+
     :param names: None means "all items"
                   otherwise give a list of storage item names
     """
     storage = current_app.storage
     if names is None:
-        names = list(storage)
-    for name in names:
+        names = storage
+    expired = []
+    now = time.time()
+    for name, meta in file_infos_executor.map(partial(file_info, storage), names):
+        if not meta:
+            # we got empty metadata, this happens for 0-byte .meta files.
+            # ignore it for now.
+            continue
+        if lifetime_over(meta, now):
+            expired.append(name)
+            continue
+        # convert size to human redable
+        meta[SIZE] = sizeof_fmt(meta[SIZE])
+        meta[ID] = name
+        yield meta
+    for name in expired:
         try:
-            with storage.open(name) as item:
-                meta = dict(item.meta)
-                if not meta:
-                    # we got empty metadata, this happens for 0-byte .meta files.
-                    # ignore it for now.
-                    continue
-                if delete_if_lifetime_over(item, name):
-                    continue
-                # convert size to human redable
-                meta[SIZE] = sizeof_fmt(meta[SIZE])
-                meta[ID] = name
-                yield meta
-        except OSError as e:
-            if e.errno != errno.ENOENT:
-                raise
-        except pickle.UnpicklingError:
-            # corrupted meta file, just ignore it for now
+            storage.remove(name)
+        except OSError:
             pass
 
 
+class RenderCache:
+    """
+    Small thread-safe LRU cache for rendered pages.
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# rendered file lists: etag -> (expiry time, html, Link header)
+filelist_cache = RenderCache(maxsize=16)
+
+# the browser may fetch the thumbnails at the top of the list together with
+# the page. not more, as big headers get rejected by some proxies.
+PRELOAD_THUMBNAILS = 12
+
+
 class FileListView(MethodView):
+    def etag(self):
+        # the page depends on the storage contents and on who is looking at it
+        state = '{} {} {}'.format(current_app.storage.version(), flaskg.logged_in,
+                                  ','.join(sorted(flaskg.permissions)))
+        return '"list-{}"'.format(hashlib.sha1(state.encode(), usedforsecurity=False).hexdigest())
+
+    def preload_links(self, files):
+        return ', '.join('<{}>; rel=preload; as=image'.format(url_for('bepasty.thumbnail', name=f[ID]))
+                         for f in files[:PRELOAD_THUMBNAILS])
+
+    def headers(self, etag=None, links=None):
+        headers = [('Cache-Control', 'no-cache')]
+        if etag:
+            headers.append(('ETag', etag))
+        if links:
+            headers.append(('Link', links))
+        return headers
+
     def get(self):
         if not may(LIST):
             raise Forbidden()
+        etag = self.etag()
+        cached = filelist_cache.get(etag)
+        if cached is not None and cached[0] > time.time():
+            if request.headers.get('If-None-Match') == etag:
+                return Response(status=304, headers=self.headers(etag))
+            expires, html, links = cached
+            return Response(html, headers=self.headers(etag, links))
+
         files = sorted(file_infos(), key=lambda f: f[TIMESTAMP_UPLOAD], reverse=True)
-        return render_template('filelist.html', files=files)
+        html = render_template('filelist.html', files=files)
+        links = self.preload_links(files)
+        if self.etag() != etag:
+            # storage changed meanwhile (maybe we removed items whose lifetime
+            # is over), so we do not know which state we have rendered.
+            return Response(html, headers=self.headers(links=links))
+        # the page needs to be rendered again when the first item expires
+        expires = min((f[TIMESTAMP_MAX_LIFE] for f in files if f[TIMESTAMP_MAX_LIFE] > 0), default=math.inf)
+        filelist_cache.put(etag, (expires, html, links))
+        return Response(html, headers=self.headers(etag, links))